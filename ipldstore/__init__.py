@@ -6,15 +6,19 @@ from .ipldstore import IPLDStore
 from .contentstore import ContentAddressableStore, MappingCAStore, IPFSStore
 
 import os, json
+import logging
 
+logger = logging.getLogger(__name__)
 
+
+# the environment is parsed once at import, get_ipfs_mapper only reads the result
 ADAPTER_SECRETS = os.getenv("ADAPTER_SECRETS", None)
 IPFS_HOST = os.getenv("IPFS_HOST", None)
 if ADAPTER_SECRETS is not None:
     IPFS_HOST = f'http://{json.loads(ADAPTER_SECRETS).get("IPFS_HOST", None)}'
 elif IPFS_HOST is not None:
     IPFS_HOST = f'http://{IPFS_HOST}'
-print(f'IPFS HOST base: {IPFS_HOST}')
+logger.debug("IPFS HOST base: %s", IPFS_HOST)
 
 
 def get_ipfs_mapper(
@@ -28,6 +32,6 @@ def get_ipfs_mapper(
     """
     if IPFS_HOST is not None:
         host = IPFS_HOST
-    print(f'ipfs mapper host: {host}')
+    logger.debug("ipfs mapper host: %s", host)
 
     return IPLDStore(IPFSStore(host, chunker=chunker, max_nodes_per_level=max_nodes_per_level), should_async_get=should_async_get)
\ No newline at end of file
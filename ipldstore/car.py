@@ -2,16 +2,18 @@
 CAR handling functions.
 """
 
-from typing import List, Optional, Tuple, Union, Iterator, BinaryIO
+from typing import List, Optional, Tuple, Iterator, BinaryIO
 import dataclasses
+import hashlib
 
 import dag_cbor
-from multiformats import CID, varint, multicodec, multihash
+from multiformats import CID, multicodec, multihash
 
 from .utils import is_cid_list, StreamLike, ensure_stream
 
 DagPbCodec = multicodec.get("dag-pb")
 Sha256Hash = multihash.get("sha2-256")
+_SHA256_CODE = Sha256Hash.code
 
 @dataclasses.dataclass
 class CARBlockLocation:
@@ -37,7 +39,7 @@ def decode_car_header(stream: BinaryIO) -> Tuple[List[CID], int]:
     """
     Decodes a CAR header and returns the list of contained roots.
     """
-    header_size, visize, _ = varint.decode_raw(stream)  # type: ignore [call-overload] # varint uses BufferedIOBase
+    header_size, visize = read_varint(stream)
     header = dag_cbor.decode(stream.read(header_size))
     if not isinstance(header, dict):
         raise ValueError("no valid CAR header found")
@@ -51,42 +53,108 @@ def decode_car_header(stream: BinaryIO) -> Tuple[List[CID], int]:
     return roots, visize + header_size
 
 
+def encode_varint(value: int) -> bytes:
+    """
+    Encodes an unsigned varint, like `multiformats.varint.encode` but without its argument validation.
+    """
+    if value < 0x80:
+        return bytes((value,))
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def read_varint(stream: BinaryIO) -> Tuple[int, int]:
+    """
+    Reads an unsigned varint from a stream, returns the value and the number of bytes read.
+    """
+    value = 0
+    shift = 0
+    while True:
+        next_byte = stream.read(1)
+        if not next_byte:
+            raise ValueError("stream ended within varint")
+        byte = next_byte[0]
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            if byte == 0 and shift > 0:
+                raise ValueError("varint is not minimally encoded")
+            return value, shift // 7 + 1
+        shift += 7
+        if shift >= 63:
+            raise ValueError("varints must be at most 9 bytes long")
+
+
+def _decode_varint(data: memoryview, offset: int) -> Tuple[int, int]:
+    """
+    Decodes an unsigned varint starting at `offset`, returns the value and the offset behind it.
+    """
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("varint exceeds available data")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            if byte == 0 and shift > 0:
+                raise ValueError("varint is not minimally encoded")
+            return value, offset
+        shift += 7
+        if shift >= 63:
+            raise ValueError("varints must be at most 9 bytes long")
+
+
+def _decode_cid_prefix(data: memoryview) -> Tuple[int, int, int, int, int]:
+    """
+    Partially decodes the CID at the start of a CAR block.
+
+    Returns version, codec, hash function, digest offset and digest size
+    without copying any of the block data.
+    """
+    if data[0] == 0x12 and data[1] == 0x20:
+        # this is CIDv0
+        return 0, DagPbCodec.code, _SHA256_CODE, 2, 32
+    # this is CIDv1(+)
+    cid_version, offset = _decode_varint(data, 0)
+    if cid_version != 1:
+        raise ValueError(f"CIDv{cid_version} is currently not supported")
+    cid_codec, offset = _decode_varint(data, offset)
+    hash_codec, offset = _decode_varint(data, offset)
+    digest_size, offset = _decode_varint(data, offset)
+    return cid_version, cid_codec, hash_codec, offset, digest_size
+
+
 def decode_raw_car_block(stream: BinaryIO) -> Optional[Tuple[CID, bytes, CARBlockLocation]]:
     try:
-        block_size, visize, _ = varint.decode_raw(stream)  # type: ignore [call-overload] # varint uses BufferedIOBase
+        block_size, visize = read_varint(stream)
     except ValueError:
         # stream has likely been consumed entirely
         return None
 
-    data = stream.read(block_size)
+    block = memoryview(stream.read(block_size))
     # as the size of the CID is variable but not explicitly given in
     # the CAR format, we need to partially decode each CID to determine
     # its size and the location of the payload data
-    if data[0] == 0x12 and data[1] == 0x20:
-        # this is CIDv0
-        cid_version = 0
-        default_base = "base58btc"
-        cid_codec: Union[int, multicodec.Multicodec] = DagPbCodec
-        hash_codec: Union[int, multihash.Multihash] = Sha256Hash
-        cid_digest = data[2:34]
-        data = data[34:]
+    cid_version, cid_codec, hash_codec, digest_offset, digest_size = _decode_cid_prefix(block)
+    payload_offset = digest_offset + digest_size
+    default_base = "base58btc" if cid_version == 0 else "base32"
+    cid = CID(default_base, cid_version, cid_codec, (hash_codec, block[digest_offset:payload_offset]))
+    data = block[payload_offset:]
+
+    if hash_codec == _SHA256_CODE and digest_size == 32:
+        # the common case, hashlib is much faster than the multihash dispatch
+        valid = hashlib.sha256(data).digest() == block[digest_offset:payload_offset]
     else:
-        # this is CIDv1(+)
-        cid_version, _, data = varint.decode_raw(data)
-        if cid_version != 1:
-            raise ValueError(f"CIDv{cid_version} is currently not supported")
-        default_base = "base32"
-        cid_codec, _, data = multicodec.unwrap_raw(data)
-        hash_codec, _, data = varint.decode_raw(data)
-        digest_size, _, data = varint.decode_raw(data)
-        cid_digest = data[:digest_size]
-        data = data[digest_size:]
-    cid = CID(default_base, cid_version, cid_codec, (hash_codec, cid_digest))
-
-    if not cid.hashfun.digest(data) == cid.digest:
+        valid = cid.hashfun.digest(data) == cid.digest
+    if not valid:
         raise ValueError(f"CAR is corrupted. Entry '{cid}' could not be verified")
 
-    return cid, bytes(data), CARBlockLocation(visize, block_size - len(data), len(data))
+    return cid, bytes(data), CARBlockLocation(visize, payload_offset, len(data))
 
 
 def read_car(stream_or_bytes: StreamLike) -> Tuple[List[CID], Iterator[Tuple[CID, bytes, CARBlockLocation]]]:
@@ -1,12 +1,19 @@
 from abc import ABC, abstractmethod
-from typing import Dict, MutableMapping, Optional, Union, overload, Iterator, MutableSet, List
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, MutableMapping, Optional, Tuple, Union, overload, Iterator, MutableSet, List
 from io import BufferedIOBase, BytesIO
-from itertools import zip_longest
+from functools import lru_cache
+from itertools import islice, zip_longest
+import base64
+import hashlib
 
 import aiohttp
 import asyncio
+import threading
+import weakref
 
-from multiformats import CID, multicodec, multibase, multihash, varint
+from multiformats import CID, multicodec, multibase, multihash
 import cbor2, dag_cbor
 from cbor2 import CBORTag
 from dag_cbor.encoding import EncodableType as DagCborEncodable
@@ -15,7 +22,7 @@ from typing_validation import validate
 import requests
 from requests.adapters import HTTPAdapter, Retry
 
-from .car import read_car
+from .car import encode_varint, read_car
 from .utils import StreamLike
 
 
@@ -24,6 +31,20 @@ ValueType = Union[bytes, DagCborEncodable]
 RawCodec = multicodec.get("raw")
 DagPbCodec = multicodec.get("dag-pb")
 DagCborCodec = multicodec.get("dag-cbor")
+Sha256Hash = multihash.get("sha2-256")
+
+# codecs are compared by their integer code in per-block code paths,
+# which is much cheaper than Multicodec.__eq__
+_RAW_CODE = RawCodec.code
+_DAGPB_CODE = DagPbCodec.code
+_DAGCBOR_CODE = DagCborCodec.code
+
+# number of blocks requested at once while walking a DAG in to_car
+TO_CAR_PREFETCH_SIZE = 256
+# seconds idle connections to the IPFS API are kept open by getitems
+ASYNC_KEEPALIVE_TIMEOUT = 60
+# read size for streaming file contents in IPFSStore.get_raw
+GET_RAW_CHUNK_SIZE = 1 << 20
 
 def default_encoder(encoder, value):
     encoder.encode(CBORTag(42,  b'\x00' + bytes(value)))
@@ -32,10 +53,52 @@ def grouper(seq, size):
     return (seq[pos:pos + size] for pos in range(0, len(seq), size))
 
 
-def get_retry_session() -> requests.Session:
+# CIDs are immutable, so their (slow) binary and multibase encodings can be memoized.
+# CID equality ignores the multibase, hence it is part of the key for strings.
+@lru_cache(maxsize=65536)
+def _encode_cid(cid: CID, base: multibase.Multibase) -> str:
+    if cid.version == 1 and base.name == "base32":
+        return _base32_str(cid_to_bytes(cid))
+    return cid.encode(base) if cid.version == 1 else cid.encode()
+
+
+def _base32_str(cid_bytes: bytes) -> str:
+    # same result as multibase "base32", but using the C implementation in the standard library
+    return "b" + base64.b32encode(cid_bytes).decode("ascii").rstrip("=").lower()
+
+
+def cid_to_str(cid: CID) -> str:
+    return _encode_cid(cid, cid.base)
+
+
+@lru_cache(maxsize=65536)
+def cid_to_bytes(cid: CID) -> bytes:
+    return bytes(cid)
+
+
+@lru_cache(maxsize=None)
+def _resolve_codec(codec: Union[str, int, multicodec.Multicodec]) -> multicodec.Multicodec:
+    if isinstance(codec, str):
+        return multicodec.get(name=codec)
+    elif isinstance(codec, int):
+        return multicodec.get(code=codec)
+    return codec
+
+
+def group_key(keys: List[str]) -> int:
+    """
+    Stable numeric label for a group of keys split off into a sub-tree.
+    """
+    digest = hashlib.blake2b(b"\x00".join(key.encode() for key in keys), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def get_retry_session(pool_maxsize: int = 64) -> requests.Session:
     session =  requests.Session()
     retries = Retry(connect=5, total=5, backoff_factor=4)
-    session.mount("http://", HTTPAdapter(max_retries=retries))
+    session.mount("http://", HTTPAdapter(max_retries=retries,
+                                         pool_connections=pool_maxsize,
+                                         pool_maxsize=pool_maxsize))
     return session
 
 
@@ -46,13 +109,16 @@ class ContentAddressableStore(ABC):
 
     def get(self, cid: CID) -> ValueType:
         value = self.get_raw(cid)
-        if cid.codec == RawCodec:
+        if cid.codec.code == _RAW_CODE:
             return value
-        elif cid.codec == DagCborCodec:
+        elif cid.codec.code == _DAGCBOR_CODE:
             return dag_cbor.decode(value)
         else:
             raise ValueError(f"can't decode CID's codec '{cid.codec.name}'")
 
+    def get_raw_many(self, cids: List[CID]) -> Dict[CID, bytes]:
+        return {cid: self.get_raw(cid) for cid in cids}
+
     def __contains__(self, cid: CID) -> bool:
         try:
             self.get_raw(cid)
@@ -68,7 +134,6 @@ class ContentAddressableStore(ABC):
         ...
 
     def put(self, value: ValueType) -> CID:
-        validate(value, ValueType)
         if isinstance(value, bytes):
             return self.put_raw(value, RawCodec)
         else:
@@ -77,6 +142,11 @@ class ContentAddressableStore(ABC):
     def normalize_cid(self, cid: CID) -> CID:  # pylint: disable=no-self-use
         return cid
 
+    def close(self) -> None:
+        """
+            Releases resources held by the store, nothing to do by default.
+        """
+
     @overload
     def to_car(self, root: CID, stream: BufferedIOBase) -> int:
         ...
@@ -98,11 +168,11 @@ class ContentAddressableStore(ABC):
 
         bytes_written = 0
         header = dag_cbor.encode({"version": 1, "roots": [root]})
-        bytes_written += stream.write(varint.encode(len(header)))
-        bytes_written += stream.write(header)
+        bytes_written += stream.write(encode_varint(len(header)) + header)
         bytes_written += self._to_car(root, stream, set())
 
         if return_bytes:
+            # BytesIO hands out its internal buffer here instead of copying it
             return buffer.getvalue()
         else:
             return bytes_written
@@ -110,24 +180,37 @@ class ContentAddressableStore(ABC):
     def _to_car(self,
                 root: CID,
                 stream: BufferedIOBase,
-                already_written: MutableSet[CID]) -> int:
+                already_written: MutableSet[bytes]) -> int:
         """
             makes a CAR without the header
         """
         bytes_written = 0
 
-        if root not in already_written:
-            data = self.get_raw(root)
-            cid_bytes = bytes(root)
-            bytes_written += stream.write(varint.encode(len(cid_bytes) + len(data)))
-            bytes_written += stream.write(cid_bytes)
+        # depth-first, children pushed in reverse to keep the block order of a recursive walk.
+        # Entries carry the binary CID, which hashes and compares much cheaper than the CID object.
+        stack = deque([(root, cid_to_bytes(root))])
+        prefetched: Dict[bytes, bytes] = {}
+        while stack:
+            cid, cid_bytes = stack.pop()
+            if cid_bytes in already_written:
+                prefetched.pop(cid_bytes, None)
+                continue
+            if cid_bytes not in prefetched:
+                # fetch the upcoming blocks of the worklist together with this one
+                batch = {cid_bytes: cid}
+                for c, c_bytes in islice(reversed(stack), TO_CAR_PREFETCH_SIZE - 1):
+                    if c_bytes not in already_written and c_bytes not in prefetched:
+                        batch[c_bytes] = c
+                fetched = self.get_raw_many(list(batch.values()))
+                for c_bytes, c in batch.items():
+                    prefetched[c_bytes] = fetched[c]
+            data = prefetched.pop(cid_bytes)
+            bytes_written += stream.write(encode_varint(len(cid_bytes) + len(data)) + cid_bytes)
             bytes_written += stream.write(data)
-            already_written.add(root)
+            already_written.add(cid_bytes)
 
-            if root.codec == DagCborCodec:
-                value = dag_cbor.decode(data)
-                for child in iter_links(value):
-                    bytes_written += self._to_car(child, stream, already_written)
+            if cid.codec.code == _DAGCBOR_CODE:
+                stack.extend((CID.decode(link), link) for link in reversed(list(_iter_cbor_link_bytes(data))))
         return bytes_written
 
     def import_car(self, stream_or_bytes: StreamLike) -> List[CID]:
@@ -165,39 +248,119 @@ class MappingCAStore(ContentAddressableStore):
         else:
             self._default_base = multibase.get(default_base)
 
+        # the default configuration can be hashed and keyed without the multiformats dispatch
+        self._sha256_base32 = self._default_hash.name == "sha2-256" and self._default_base.name == "base32"
+
     def normalize_cid(self, cid: CID) -> CID:
         return cid.set(base=self._default_base, version=1)
 
     def get_raw(self, cid: CID) -> bytes:
-        validate(cid, CID)
-        return self._mapping[str(self.normalize_cid(cid))]
+        return self._mapping[cid_to_str(self.normalize_cid(cid))]
 
     def put_raw(self,
                 raw_value: bytes,
                 codec: Union[str, int, multicodec.Multicodec]) -> CID:
-        validate(raw_value, bytes)
-        validate(codec, Union[str, int, multicodec.Multicodec])
-
+        if self._sha256_base32:
+            return self._put_raw_sha256_base32(raw_value, _resolve_codec(codec))
         h = self._default_hash.digest(raw_value)
         cid = CID(self._default_base, 1, codec, h)
-        self._mapping[str(cid)] = raw_value
+        self._mapping[cid_to_str(cid)] = raw_value
         return cid
 
+    def _put_raw_sha256_base32(self, raw_value: bytes, codec: multicodec.Multicodec) -> CID:
+        digest = hashlib.sha256(raw_value).digest()
+        cid_bytes = b"\x01" + encode_varint(codec.code) + b"\x12\x20" + digest
+        self._mapping[_base32_str(cid_bytes)] = raw_value
+        return CID(self._default_base, 1, codec, (Sha256Hash, digest))
+
 
 async def _async_get(host: str, session: aiohttp.ClientSession, cid: CID):
-    if cid.codec == DagPbCodec:
+    if cid.codec.code == _DAGPB_CODE:
         api_method = "/api/v0/cat"
     else:
         api_method = "/api/v0/block/get"
-    async with session.post(host + api_method, params={"arg": str(cid)}) as resp:
+    async with session.post(host + api_method, params={"arg": cid_to_str(cid)}) as resp:
+        resp.raise_for_status()
         return await resp.read()
 
-async def _main_async(keys: List[CID], host: str, d: Dict[CID, bytes]):
-    async with aiohttp.ClientSession() as session:
-        tasks = [_async_get(host, session, key) for key in keys]
-        byte_list = await asyncio.gather(*tasks)
-        for i, key in enumerate(keys):
-            d[key] = byte_list[i]
+async def _main_async(keys: List[CID], host: str, d: Dict[CID, bytes], session: aiohttp.ClientSession, depth: int = 128):
+    # a fixed number of workers drains the shared key iterator, so at most
+    # `depth` requests are in flight and results land in `d` as they complete
+    pending = iter(keys)
+
+    async def worker():
+        for key in pending:
+            d[key] = await _async_get(host, session, key)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(depth, len(keys)))]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        # the event loop outlives this call, so workers left pending after a
+        # failure would keep running into the next getitems
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+
+
+class _Connections:
+    """
+        HTTP sessions of an IPFSStore, opened on first use.
+
+        Requests through aiohttp all run on one event loop in a daemon thread, so
+        calling threads neither need a loop of their own nor may already be running one.
+    """
+    def __init__(self, depth: int):
+        self._depth = depth
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._async_session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                # keep-alive connections to the IPFS API are reused across calls
+                self._session = get_retry_session()
+            return self._session
+
+    def run(self, coro):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="ipfsstore-aiohttp", daemon=True)
+                self._thread.start()
+            loop = self._loop
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def async_session(self) -> aiohttp.ClientSession:
+        # only ever called on the loop thread, so no locking needed
+        if self._async_session is None:
+            # one keep-alive connection per in-flight request, kept open
+            # between getitems calls so consecutive chunk reads reuse them
+            connector = aiohttp.TCPConnector(limit=self._depth,
+                                             limit_per_host=self._depth,
+                                             keepalive_timeout=ASYNC_KEEPALIVE_TIMEOUT)
+            self._async_session = aiohttp.ClientSession(connector=connector)
+        return self._async_session
+
+    def close(self) -> None:
+        with self._lock:
+            session, self._session = self._session, None
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+            async_session, self._async_session = self._async_session, None
+        if session is not None:
+            session.close()
+        if loop is not None:
+            if async_session is not None:
+                asyncio.run_coroutine_threadsafe(async_session.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
 
 
 class IPFSStore(ContentAddressableStore):
@@ -206,111 +369,198 @@ class IPFSStore(ContentAddressableStore):
                  chunker: str = "size-262144",
                  max_nodes_per_level: int = 10000,
                  default_hash: Union[str, int, multicodec.Multicodec, multihash.Multihash] = "sha2-256",
+                 depth: int = 128,
                  ):
         validate(host, str)
         validate(default_hash, Union[str, int, multicodec.Multicodec, multihash.Multihash])
+        validate(depth, int)
+        if depth < 1:
+            raise ValueError(f"depth must be at least 1, got {depth}")
+        if max_nodes_per_level < 2:
+            # a level can only shrink if at least two of its entries are grouped together
+            raise ValueError(f"max_nodes_per_level must be at least 2, got {max_nodes_per_level}")
 
         self._host = host
         self._chunker = chunker
         self._max_nodes_per_level = max_nodes_per_level
+        self._depth = depth
 
         if isinstance(default_hash, multihash.Multihash):
             self._default_hash = default_hash
         else:
             self._default_hash = multihash.Multihash(codec=default_hash)
 
+        self._init_connections()
+
+    def _init_connections(self) -> None:
+        self._connections = _Connections(self._depth)
+        # the finalizer must not reference self, or the store would never be collected
+        self._finalizer = weakref.finalize(self, self._connections.close)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # open connections and threads can't be pickled, unpickled stores open their own.
+        # Multihash instances may hold a hash function once used, so only the name is kept.
+        state = self.__dict__.copy()
+        del state["_connections"]
+        del state["_finalizer"]
+        state["_default_hash"] = self._default_hash.name
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._default_hash = multihash.Multihash(codec=state["_default_hash"])
+        self._init_connections()
+
+    @property
+    def _session(self) -> requests.Session:
+        return self._connections.session
+
+    def close(self) -> None:
+        """
+            Closes the HTTP sessions and the event loop thread of this store, they are reopened on next use.
+            Must not be called while another thread is inside getitems.
+        """
+        self._connections.close()
+
     def recover_tree(self, broken_struct):
         if not isinstance(broken_struct, dict):
             return broken_struct
-        all_recovered = []
         ret_tree = {}
-        for k in broken_struct:
-            if len(k) > 1 and k.startswith("/") and k[2:].isnumeric():
-                cid_to_recover = CID.decode(broken_struct[k].value[1:])
-                recovered = self.recover_tree(cbor2.loads(self.get_raw(cid_to_recover)))
-                all_recovered.append(recovered)
-            else:
-                ret_tree[k] = self.recover_tree(broken_struct[k])
-        for recovered in all_recovered:
-            for k in recovered:
-                ret_tree[k] = self.recover_tree(recovered[k])
+        # breadth-first over (stored dict, recovered dict) pairs, so that all
+        # sub-trees referenced on one level are fetched in a single batch
+        level = [(broken_struct, ret_tree)]
+        while level:
+            next_level = []
+            to_recover = []
+            for broken, recovered in level:
+                for k, v in broken.items():
+                    if len(k) > 1 and k.startswith("/") and k[2:].isnumeric():
+                        to_recover.append((CID.decode(v.value[1:]), recovered))
+                    elif isinstance(v, dict):
+                        recovered[k] = {}
+                        next_level.append((v, recovered[k]))
+                    else:
+                        recovered[k] = v
+            if to_recover:
+                sub_trees = self.getitems([cid for cid, _ in to_recover])
+                for cid, recovered in to_recover:
+                    next_level.append((cbor2.loads(sub_trees[cid]), recovered))
+            level = next_level
 
         return ret_tree
 
     def get(self, cid: CID) -> ValueType:
         value = self.get_raw(cid)
-        if cid.codec == DagPbCodec:
+        if cid.codec.code == _DAGPB_CODE:
             return value
-        elif cid.codec == DagCborCodec:
+        elif cid.codec.code == _DAGCBOR_CODE:
             return self.recover_tree(cbor2.loads(value))
         else:
             raise ValueError(f"can't decode CID's codec '{cid.codec.name}'")
 
+    def import_car(self, stream_or_bytes: StreamLike, max_workers: int = 32) -> List[CID]:
+        roots, blocks = read_car(stream_or_bytes)
+        roots = [self.normalize_cid(root) for root in roots]
+
+        # blocks are uploaded concurrently while the CAR is still being decoded,
+        # the number of pending uploads is bounded to keep memory use in check
+        pending: Deque[Future] = deque()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                for cid, data, _ in blocks:
+                    if len(pending) >= 2 * max_workers:
+                        pending.popleft().result()
+                    pending.append(executor.submit(self.put_raw, bytes(data), cid.codec))
+                for future in pending:
+                    future.result()
+            except BaseException:
+                # leaving the executor waits for all queued uploads, drop those not started yet
+                for future in pending:
+                    future.cancel()
+                raise
+
+        return roots
+
     def getitems(self, keys: List[CID]) -> Dict[CID, bytes]:
-        ret = {}
-        asyncio.run(_main_async(keys, self._host, ret))
+        ret: Dict[CID, bytes] = {}
+
+        async def run():
+            await _main_async(keys, self._host, ret, await self._connections.async_session(), self._depth)
+
+        self._connections.run(run())
         return ret
 
-    def get_raw(self, cid: CID) -> bytes:
-        validate(cid, CID)
+    def get_raw_many(self, cids: List[CID]) -> Dict[CID, bytes]:
+        return self.getitems(cids)
 
-        session = get_retry_session()
-    
-        if cid.codec == DagPbCodec:
-            res = session.post(self._host + "/api/v0/cat", params={"arg": str(cid)})
-        else:
-            res = session.post(self._host + "/api/v0/block/get", params={"arg": str(cid)})
+    def get_raw(self, cid: CID) -> bytes:
+        if cid.codec.code == _DAGPB_CODE:
+            # file contents may be large, read them in bigger pieces than
+            # the 10 KiB requests uses to assemble `res.content`
+            with self._session.post(self._host + "/api/v0/cat", params={"arg": cid_to_str(cid)}, stream=True) as res:
+                res.raise_for_status()
+                return b"".join(res.iter_content(GET_RAW_CHUNK_SIZE))
+        res = self._session.post(self._host + "/api/v0/block/get", params={"arg": cid_to_str(cid)})
         res.raise_for_status()
         return res.content
 
-    def make_tree_structure(self, node):
+    def _tree_level(self, node: Dict[str, Any]) -> Dict[str, Any]:
+        """
+            Returns the entries of `node` as they are stored on one level: if there
+            are too many, groups of them are stored as separate sub-trees and linked instead.
+        """
+        while len(node) > self._max_nodes_per_level:
+            grouped = {}
+            for group_of_keys in grouper(list(node.keys()), self._max_nodes_per_level):
+                key_for_group = f"/{group_key(group_of_keys)}"
+                grouped[key_for_group] = self.put_sub_tree({key: node[key] for key in group_of_keys})
+            node = grouped
+        return node
+
+    def _encode_tree(self, encoder: cbor2.CBOREncoder, node: Any) -> None:
         if not isinstance(node, dict):
-            return node
-        new_tree = {}
-        if len(node) <= self._max_nodes_per_level:
-            for key in node:
-                new_tree[key] = self.make_tree_structure(node[key])
-            return new_tree
-        for group_of_keys in grouper(list(node.keys()), self._max_nodes_per_level):
-            key_for_group = f"/{hash(frozenset(group_of_keys))}"
-            sub_tree = {}
-            for key in group_of_keys:
-                sub_tree[key] = node[key]
-            new_tree[key_for_group] = self.put_sub_tree(self.make_tree_structure(sub_tree))
-        return self.make_tree_structure(new_tree)
+            encoder.encode(node)
+            return
+        level = self._tree_level(node)
+        encoder.encode_length(5, len(level))  # major type 5: map
+        for key, value in level.items():
+            encoder.encode(key)
+            self._encode_tree(encoder, value)
+
+    def _dumps_tree(self, node: Any) -> bytes:
+        """
+            Encodes `node` to CBOR, splitting large levels into sub-trees while writing.
+        """
+        buffer = BytesIO()
+        self._encode_tree(cbor2.CBOREncoder(buffer, default=default_encoder), node)
+        return buffer.getvalue()
 
     def put_sub_tree(self, d):
-        return self.put_raw(cbor2.dumps(d, default=default_encoder), DagCborCodec, should_pin=False)
+        return self.put_raw(self._dumps_tree(d), DagCborCodec, should_pin=False)
 
     def put(self, value: ValueType) -> CID:
-        validate(value, ValueType)
         if isinstance(value, bytes):
             return self.put_raw(value, DagPbCodec)
         else:
-            return self.put_raw(cbor2.dumps(self.make_tree_structure(value), default=default_encoder), DagCborCodec)
+            return self.put_raw(self._dumps_tree(value), DagCborCodec)
 
     def put_raw(self,
                 raw_value: bytes,
                 codec: Union[str, int, multicodec.Multicodec],
                 should_pin=True) -> CID:
-        validate(raw_value, bytes)
-        validate(codec, Union[str, int, multicodec.Multicodec])
-
         if isinstance(codec, str):
             codec = multicodec.get(name=codec)
         elif isinstance(codec, int):
             codec = multicodec.get(code=codec)
 
-        session = get_retry_session()
-
-        if codec == DagPbCodec:
-            res = session.post(self._host + "/api/v0/add",
+        if codec.code == _DAGPB_CODE:
+            res = self._session.post(self._host + "/api/v0/add",
                                 params={"pin": False, "chunker": self._chunker},
                                 files={"dummy": raw_value})
             res.raise_for_status()
             return CID.decode(res.json()["Hash"])
         else:
-            res = session.post(self._host + "/api/v0/dag/put",
+            res = self._session.post(self._host + "/api/v0/dag/put",
                             params={"store-codec": codec.name,
                                     "input-codec": codec.name,
                                     "pin": should_pin,
@@ -320,15 +570,75 @@ class IPFSStore(ContentAddressableStore):
             return CID.decode(res.json()["Cid"]["/"])
 
 
-def iter_links(o: DagCborEncodable) -> Iterator[CID]:
-    if isinstance(o, dict):
-        for v in o.values():
-            yield from iter_links(v)
-    elif isinstance(o, list):
-        for v in o:
-            yield from iter_links(v)
-    elif isinstance(o, CID):
-        yield o
+def _read_cbor_head(data: memoryview, pos: int) -> Tuple[int, int, int]:
+    """
+    Reads the head of a CBOR data item, returns major type, argument and position behind the head.
+    """
+    initial = data[pos]
+    major = initial >> 5
+    info = initial & 0x1f
+    if info < 24:
+        return major, info, pos + 1
+    if info > 27:
+        raise ValueError("indefinite length items are not allowed in DAG-CBOR")
+    size = 1 << (info - 24)
+    return major, int.from_bytes(data[pos + 1:pos + 1 + size], "big"), pos + 1 + size
+
+
+def iter_cbor_links(data: bytes) -> Iterator[CID]:
+    """
+    Yields the links (tag 42) of an encoded DAG-CBOR block in document order, without decoding it.
+    """
+    for link in _iter_cbor_link_bytes(data):
+        yield CID.decode(link)
+
+
+def _iter_cbor_link_bytes(data: bytes) -> Iterator[bytes]:
+    view = memoryview(data)
+    pos = 0
+    # CBOR items are laid out in pre-order, so counting the items still to be
+    # skipped is enough to walk arbitrarily nested arrays and maps
+    pending = 1
+    while pending:
+        pending -= 1
+        major, arg, pos = _read_cbor_head(view, pos)
+        if major == 2 or major == 3:  # byte / text string
+            pos += arg
+        elif major == 4:  # array
+            pending += arg
+        elif major == 5:  # map
+            pending += 2 * arg
+        elif major == 6:  # tag
+            if arg == 42:
+                _, size, pos = _read_cbor_head(view, pos)
+                # links are byte strings prefixed with the multibase identity byte 0x00
+                yield bytes(view[pos + 1:pos + size])
+                pos += size
+            else:
+                pending += 1
 
 
-__all__ = ["ContentAddressableStore", "MappingCAStore", "iter_links"]
+_LEAF_TYPES = frozenset([str, bytes, int, float, bool, type(None)])
+
+
+def iter_links(o: DagCborEncodable) -> Iterator[CID]:
+    stack = deque([o])
+    while stack:
+        v = stack.pop()
+        # exact type checks first, decoded trees only contain builtin containers and scalars
+        t = type(v)
+        if t is dict:
+            stack.extend(reversed(v.values()))
+        elif t is list:
+            stack.extend(reversed(v))
+        elif t in _LEAF_TYPES:
+            continue
+        elif isinstance(v, CID):
+            yield v
+        elif isinstance(v, dict):
+            stack.extend(reversed(v.values()))
+        elif isinstance(v, list):
+            stack.extend(reversed(v))
+
+
+__all__ = ["ContentAddressableStore", "MappingCAStore", "iter_links", "iter_cbor_links"]
@@ -147,6 +147,18 @@ class IPLDStore(MutableMappingSB):
         self.root_cid = None
         self._mapping = {}
 
+    def close(self) -> None:
+        """
+            Releases the connections held by the underlying content addressable store.
+        """
+        self._store.close()
+
+    def __enter__(self) -> "IPLDStore":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
     @overload
     def to_car(self, stream: BufferedIOBase) -> int:
         ...
@@ -1,6 +1,8 @@
 from io import BytesIO
 
 import ipldstore.car as car
+from ipldstore.contentstore import MappingCAStore
+from multiformats import varint
 
 import pytest
 
@@ -9,3 +11,16 @@ def test_car_reject_v2():
     stream = BytesIO(v2_start)
     with pytest.raises(ValueError):
         car.decode_car_header(stream)
+
+def test_car_detects_corrupted_block():
+    s = MappingCAStore()
+    root = s.put(b"hallo")
+    data = bytearray(s.to_car(root))
+    data[-1] ^= 0xff
+    _, blocks = car.read_car(bytes(data))
+    with pytest.raises(ValueError):
+        list(blocks)
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 16384, 2**35 + 7, 2**63 - 1])
+def test_encode_varint(value):
+    assert car.encode_varint(value) == varint.encode(value)
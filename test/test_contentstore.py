@@ -1,6 +1,13 @@
-from ipldstore.contentstore import MappingCAStore
+from ipldstore.contentstore import MappingCAStore, IPFSStore, iter_links, iter_cbor_links, \
+    default_encoder, group_key, grouper
+from ipldstore import contentstore, IPLDStore
 from multiformats import CID
+import dag_cbor
+import cbor2
 
+import asyncio
+import pickle
+import threading
 import pytest
 
 test_cid = CID("base58btc", 1, "raw",
@@ -43,3 +50,225 @@ def test_car_roundtrip(values):
     assert s2.get(root) == all_cids
     for cid, value in keyed_values:
         assert s2.get(cid) == value
+
+
+def test_to_car_fetches_each_block_once():
+    batches = []
+
+    class RecordingStore(MappingCAStore):
+        def get_raw_many(self, cids):
+            batches.append(cids)
+            return super().get_raw_many(cids)
+
+    s = RecordingStore()
+    leaf = s.put(b"leaf")
+    root = s.put([leaf, s.put([leaf, leaf]), leaf])
+    s.to_car(root)
+    fetched = [cid for batch in batches for cid in batch]
+    assert len(fetched) == len(set(fetched)) == 3
+
+
+other_cid = CID("base32", 1, "dag-cbor",
+"12206e6ff7950a36187a801613426e858dce686cd7d7e3c0fc42ee0330072d245c95")
+
+@pytest.mark.parametrize("value", [test_cid,
+                                   [test_cid, other_cid],
+                                   {"a": [1, {"b": test_cid}], "c": other_cid, "d": 1.5},
+                                   {"x": "no links", "y": [b"\x00", None, -1]}])
+def test_iter_cbor_links(value):
+    assert list(iter_cbor_links(dag_cbor.encode(value))) == list(iter_links(value))
+
+
+@pytest.mark.parametrize("default_hash", ["sha2-256", "sha2-512"])
+@pytest.mark.parametrize("codec", ["raw", "dag-cbor", 0x55])
+def test_put_raw_keys_match_cid(default_hash, codec):
+    mapping = {}
+    s = MappingCAStore(mapping, default_hash=default_hash)
+    cid = s.put_raw(b"hallo", codec)
+    assert list(mapping) == [cid.encode("base32")]
+    assert cid == CID("base32", 1, codec, (default_hash, cid.raw_digest))
+    assert s.get_raw(cid) == b"hallo"
+
+
+def test_ipfs_store_shares_one_loop_between_threads():
+    s = IPFSStore("http://127.0.0.1:1")
+    threads_before = threading.active_count()
+
+    threads = [threading.Thread(target=s.getitems, args=([],)) for _ in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert threading.active_count() == threads_before + 1
+
+    loop = s._connections._loop
+    s.close()
+    assert loop.is_closed()
+    assert threading.active_count() == threads_before
+    # closed stores reopen their connections on next use
+    assert s.getitems([]) == {}
+    s.close()
+
+
+def test_ipfs_store_pickle_roundtrip():
+    s = IPFSStore("http://127.0.0.1:1", depth=3, max_nodes_per_level=7)
+    s.getitems([])
+    s2 = pickle.loads(pickle.dumps(IPLDStore(s, should_async_get=False)))._store
+    assert (s2._host, s2._depth, s2._max_nodes_per_level) == ("http://127.0.0.1:1", 3, 7)
+    assert s2.getitems([]) == {}
+    s.close()
+    s2.close()
+
+
+def test_getitems_failure_cancels_pending_requests(monkeypatch):
+    requested = []
+
+    async def fake_async_get(host, session, cid):
+        requested.append(cid)
+        if cid == test_cid:
+            raise ValueError("block not found")
+        await asyncio.sleep(0.01)
+        return b""
+
+    monkeypatch.setattr(contentstore, "_async_get", fake_async_get)
+    s = IPFSStore("http://127.0.0.1:1", depth=2)
+    with pytest.raises(ValueError):
+        s.getitems([test_cid, other_cid, other_cid.set(codec="raw")])
+
+    async def pending_tasks():
+        return asyncio.all_tasks() - {asyncio.current_task()}
+    assert not s._connections.run(pending_tasks())
+
+    requested.clear()
+    s.getitems([other_cid])
+    assert requested == [other_cid]
+    s.close()
+
+
+class StubIPFSStore(IPFSStore):
+    """
+    IPFSStore keeping its blocks in a MappingCAStore instead of talking to a daemon.
+    """
+    def __init__(self, **kwargs):
+        super().__init__("http://127.0.0.1:1", **kwargs)
+        self.blocks = MappingCAStore()
+        self.getitems_calls = []
+
+    def get_raw(self, cid):
+        return self.blocks.get_raw(cid)
+
+    def getitems(self, keys):
+        self.getitems_calls.append(list(keys))
+        return {key: self.blocks.get_raw(key) for key in keys}
+
+    def put_raw(self, raw_value, codec, should_pin=True):
+        return self.blocks.put_raw(raw_value, codec)
+
+
+def test_recover_tree_deep_chain():
+    s = StubIPFSStore()
+    depth = 3000
+    cid = s.put_raw(cbor2.dumps({"k0": 0}), "dag-cbor")
+    for i in range(1, depth):
+        cid = s.put_raw(cbor2.dumps({"/10": cbor2.CBORTag(42, b"\x00" + bytes(cid)), f"k{i}": i}), "dag-cbor")
+    assert s.get(cid) == {f"k{i}": i for i in range(depth)}
+    assert len(s.getitems_calls) == depth - 1
+
+
+def test_recover_tree_fetches_one_batch_per_level():
+    s = StubIPFSStore(max_nodes_per_level=2)
+    value = {"a": {str(i): i for i in range(8)}, "b": {str(i): str(i) for i in range(8)}}
+    cid = s.put(value)
+    assert s.get(cid) == value
+    assert [len(keys) for keys in s.getitems_calls] == [4, 8]
+
+
+def make_tree_structure(s, node):
+    # tree building of IPFSStore.put before it encoded trees in a single pass
+    if not isinstance(node, dict):
+        return node
+    if len(node) <= s._max_nodes_per_level:
+        return {key: make_tree_structure(s, value) for key, value in node.items()}
+    new_tree = {}
+    for group_of_keys in grouper(list(node.keys()), s._max_nodes_per_level):
+        sub_tree = make_tree_structure(s, {key: node[key] for key in group_of_keys})
+        new_tree[f"/{group_key(group_of_keys)}"] = s.put_raw(cbor2.dumps(sub_tree, default=default_encoder), "dag-cbor")
+    return make_tree_structure(s, new_tree)
+
+
+@pytest.mark.parametrize("max_nodes_per_level", [2, 3, 5])
+def test_ipfs_store_tree_roundtrip(max_nodes_per_level):
+    s = StubIPFSStore(max_nodes_per_level=max_nodes_per_level)
+    value = {"x": {str(i): i for i in range(40)},
+             "y": {"z": {str(i): {"v": str(i)} for i in range(7)}, "w": test_cid},
+             **{f"k{i}": [i, b"bytes"] for i in range(6)}}
+    cid = s.put(value)
+    expected = cbor2.dumps(make_tree_structure(s, value), default=default_encoder)
+    assert s.get_raw(cid) == expected
+    # IPFSStore decodes links as plain CBOR tags
+    value["y"]["w"] = cbor2.CBORTag(42, b"\x00" + bytes(test_cid))
+    assert s.get(cid) == value
+    assert s.recover_tree(cbor2.loads(s.get_raw(cid))) == value
+
+
+def test_ipfs_store_rejects_single_node_levels():
+    with pytest.raises(ValueError):
+        IPFSStore("http://127.0.0.1:1", max_nodes_per_level=1)
+
+
+def test_tree_split_is_independent_of_hash_seed():
+    # pinned values, they must not change with PYTHONHASHSEED or between runs
+    assert group_key(["a", "b", "c"]) == 11532430043990989325
+    s = StubIPFSStore(max_nodes_per_level=2)
+    cid = s.put({str(i): i for i in range(5)})
+    assert str(cid) == "bafyreicjikxdlfppdkodsrqbvi5robdurbyma34nkgdjnjaddsueisn67q"
+
+
+def test_sync_reads_inside_running_event_loop(monkeypatch):
+    s = StubIPFSStore(max_nodes_per_level=2)
+    value = {str(i): i for i in range(5)}
+    root = s.put(value)
+
+    async def fake_async_get(host, session, cid):
+        return s.blocks.get_raw(cid)
+
+    # read through the event loop of the store instead of the stub's getitems
+    monkeypatch.setattr(contentstore, "_async_get", fake_async_get)
+    monkeypatch.setattr(StubIPFSStore, "getitems", IPFSStore.getitems)
+
+    async def main():
+        return s.get(root), s.to_car(root)
+
+    assert asyncio.run(main()) == (value, s.blocks.to_car(root))
+    s.close()
+
+
+def test_ipfs_store_import_car():
+    source = MappingCAStore()
+    root = source.put([source.put(str(i).encode()) for i in range(100)])
+    s = StubIPFSStore()
+    assert s.import_car(source.to_car(root), max_workers=4) == [root]
+    assert s.blocks._mapping == source._mapping
+
+
+def test_ipfs_store_import_car_failure_cancels_uploads():
+    source = MappingCAStore()
+    root = source.put([source.put(str(i).encode()) for i in range(10)])
+    release = threading.Event()
+    uploaded = []
+
+    class FailingStore(StubIPFSStore):
+        def put_raw(self, raw_value, codec, should_pin=True):
+            # the root is the first block of the CAR
+            if codec.name == "dag-cbor":
+                raise ValueError("upload failed")
+            release.wait(5)
+            uploaded.append(raw_value)
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    with pytest.raises(ValueError, match="upload failed"):
+        FailingStore().import_car(source.to_car(root), max_workers=2)
+    timer.join()
+    # the two running uploads complete, the one still queued is cancelled
+    assert sorted(uploaded) == [b"0", b"1"]